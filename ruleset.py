@@ -8,87 +8,313 @@
 
 # coded by: Animesh Karnewar
 
+from __future__ import annotations
+
+import ctypes
+import os
+import sys
+from typing import Hashable, Iterator, Optional
+
+# numba is an optional dependency. It is only used to speed up the closure
+# computation (and its transposition) of large RuleSets.
+try:
+    import numpy as np
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+# the native closure helpers of warshall.c are optional as well. They are only
+# used if the shared library has been built next to this module.
+try:
+    _libwarshall = ctypes.CDLL(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                            "libwarshall.so"))
+    _libwarshall.warshall.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int]
+    _libwarshall.warshall.restype = None
+    _libwarshall.transpose.argtypes = [ctypes.c_void_p, ctypes.c_void_p,
+                                       ctypes.c_int, ctypes.c_int]
+    _libwarshall.transpose.restype = None
+    HAVE_CLIB = True
+except (OSError, AttributeError):
+    # not built, or a stale library without the expected symbols
+    HAVE_CLIB = False
+
+# minimum number of symbols for which the compiled (native or jit) closure pays off
+JIT_MIN_SYMBOLS = 128
+
+# maximum number of symbols for which the plain Warshall's algorithm on the int
+# rows beats the SCC based closure
+WARSHALL_MAX_SYMBOLS = 64
+
+
+if(HAVE_NUMBA):
+    @njit(cache=True, parallel=True)
+    def _warshall(rows: np.ndarray) -> None:
+        '''
+            Warshall's algorithm on a bit packed adjacency matrix. Row i holds the
+            bits of the symbols that symbol i depends on, 64 per uint64 word.
+            The rows are updated in place into the transitive closure.
+        '''
+        n, words = rows.shape
+        for k in range(n):
+            kw = k >> 6; kb = np.uint64(1) << np.uint64(k & 63)
+            # row k doesn't change during round k, so the rows can be updated
+            # in parallel
+            for i in prange(n):
+                if(rows[i, kw] & kb):
+                    for w in range(words):
+                        rows[i, w] |= rows[k, w]
+
+
+    @njit(cache=True, parallel=True)
+    def _transpose(rows: np.ndarray) -> np.ndarray:
+        '''
+            transpose a bit packed square matrix (64 bits per uint64 word)
+            @return => the transposed matrix
+        '''
+        n, words = rows.shape
+        result = np.zeros((n, words), dtype=np.uint64)
+        # every j owns its own result row, so they can be filled in parallel
+        for j in prange(n):
+            jw = j >> 6; jb = np.uint64(1) << np.uint64(j & 63)
+            for i in range(n):
+                if(rows[i, jw] & jb):
+                    result[j, i >> 6] |= np.uint64(1) << np.uint64(i & 63)
+
+        return result
+
+
+def _pack(rows: list[int], words: int) -> np.ndarray:
+    '''
+        helper to pack python int rows into a uint64 matrix
+        @param
+        rows => list of the int bitmask rows
+        words => number of uint64 words per row
+        @return => the (len(rows), words) uint64 matrix
+    '''
+    # the little endian bytes of an int are exactly its words, lowest first
+    size = words << 3
+    data = b"".join([row.to_bytes(size, "little") for row in rows])
+    return np.frombuffer(data, dtype="<u8").reshape(len(rows), words).astype(np.uint64)
+
+
+def _unpack(matrix: np.ndarray) -> list[int]:
+    '''
+        helper to unpack a uint64 matrix back into python int rows
+        @param
+        matrix => the uint64 matrix
+        @return => list of the int bitmask rows
+    '''
+    data = matrix.astype("<u8")
+    return [int.from_bytes(data[i].tobytes(), "little") for i in range(data.shape[0])]
+
+
+def _jitClosure(rows: list[int]) -> tuple[list[int], list[int]]:
+    '''
+        helper to run the jit compiled Warshall's algorithm on python int rows
+        @param
+        rows => list of the int bitmask rows of the adjacency
+        @return => (list of the int bitmask rows of the transitive closure,
+                    list of the int bitmask rows of its transpose)
+    '''
+    words = (len(rows) + 63) >> 6
+
+    matrix = _pack(rows, words)
+    _warshall(matrix)
+
+    return _unpack(matrix), _unpack(_transpose(matrix))
+
+
+def _cClosure(rows: list[int]) -> tuple[list[int], list[int]]:
+    '''
+        helper to run the native Warshall's algorithm of warshall.c on python
+        int rows
+        @param
+        rows => list of the int bitmask rows of the adjacency
+        @return => (list of the int bitmask rows of the transitive closure,
+                    list of the int bitmask rows of its transpose)
+    '''
+    n = len(rows); words = (n + 63) >> 6
+    size = words << 3 # bytes per row
+
+    # the bytes of an int in the native byte order are exactly the uint64 words
+    # the C code expects, lowest first
+    data = bytearray(b"".join([row.to_bytes(size, sys.byteorder) for row in rows]))
+    matrix = (ctypes.c_uint64 * (n * words)).from_buffer(data)
+    _libwarshall.warshall(matrix, words, n)
+
+    tdata = bytearray(len(data)) # zeroed
+    tmatrix = (ctypes.c_uint64 * (n * words)).from_buffer(tdata)
+    _libwarshall.transpose(matrix, tmatrix, words, n)
+
+    def unpack(buf: bytearray) -> list[int]:
+        return [int.from_bytes(buf[i * size:(i + 1) * size], sys.byteorder) for i in range(n)]
+
+    return unpack(data), unpack(tdata)
+
+
+def _warshallClosure(rows: list[int]) -> list[int]:
+    '''
+        helper to compute the transitive closure of small graphs with Warshall's
+        algorithm directly on the python int rows (one bitwise or per update)
+        @param
+        rows => list of the int bitmask rows of the adjacency
+        @return => list of the int bitmask rows of the transitive closure
+    '''
+    closure = list(rows); n = len(closure)
+    for k in range(n):
+        kb = 1 << k; row_k = closure[k]
+        if(not row_k):
+            continue # nothing to propagate through k
+        for i in range(n):
+            if(closure[i] & kb):
+                closure[i] |= row_k
+    return closure
+
+
+def _bits(mask: int) -> list[int]:
+    '''
+        helper to list the indices of the set bits of a mask
+        @param
+        mask => the bitmask
+        @return => list of the indices of the set bits, lowest first
+    '''
+    indices = []
+    while(mask):
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+
+    return indices
+
+
+def _sccClosure(rows: list[int], rrows: list[int]) -> list[int]:
+    '''
+        helper to compute the transitive closure of int bitmask rows. The strongly
+        connected components (symbols depending on each other through a cycle)
+        are found first, then the rows are merged in reverse topological order of
+        the components, so every row is merged only once.
+        @param
+        rows => list of the int bitmask rows of the adjacency
+        rrows => list of the int bitmask rows of the reversed adjacency
+        @return => list of the int bitmask rows of the transitive closure
+    '''
+    n = len(rows)
+
+    # first pass (Kosaraju): iterative DFS over the rows recording the order in
+    # which the symbols are finished
+    order = []; visited = 0
+    for start in range(n):
+        if((visited >> start) & 1):
+            continue
+        visited |= 1 << start
+        stack = [(start, rows[start])]
+        while(stack):
+            node, pending = stack[-1]
+            pending &= ~visited
+            if(pending):
+                low = pending & -pending
+                stack[-1] = (node, pending ^ low)
+                visited |= low
+                nxt = low.bit_length() - 1
+                stack.append((nxt, rows[nxt]))
+            else:
+                stack.pop(); order.append(node)
+
+    # second pass: DFS over the reversed rows in the reverse finishing order.
+    # The components come out in topological order (dependants first)
+    components = []; assigned = 0
+    for start in reversed(order):
+        if((assigned >> start) & 1):
+            continue
+        assigned |= 1 << start
+        members = []; todo = [start]
+        while(todo):
+            node = todo.pop(); members.append(node)
+            new = rrows[node] & ~assigned
+            assigned |= new
+            todo.extend(_bits(new))
+        components.append(members)
+
+    # merge the rows starting from the components nothing else is left to
+    # depend on. Within a component every member reaches the same symbols.
+    closure = [0] * n
+    for members in reversed(components):
+        direct = 0
+        for member in members:
+            direct |= rows[member]
+        reach = direct
+        for node in _bits(direct):
+            reach |= closure[node] # already final, or inside this component
+        for member in members:
+            closure[member] = reach
+
+    return closure
+
 
 class Options:
     '''
         The Data type for emulating the Options "Opts" :D
     '''
 
-    def __init__(self, rules):
+    def __init__(self, rules: RuleSet) -> None:
         '''
             constructor of the class. The options need to be constructed using the
             ruleSet composed with it.
         '''
-        # initialize the selection set to empty
-        self.__selection = set() # empty set
+        # initialize the selection to empty. The selection is held as a bitmask
+        # of the symbol ids of the RuleSet
+        self.__selection: int = 0 # empty set
 
         # make sure that the rules passed to the constructor are coherent
         assert rules.isCoherent(), "Options cannot be formed since rules are not coherent"
 
         # attach ther rules to a private data member
-        self.__rules = rules
+        self.__rules: RuleSet = rules
+
+        # the rules are queried on every toggle, so precompute the answers
+        rules.freeze()
 
 
     # ==========================================================================
     # Private helper methods:
     # ==========================================================================
-    def __switch_on(self, opt):
+    def __switch_on(self, opt: Hashable) -> None:
         '''
             private helper to turn on a particular option including it's
             dependencies.
             @param
             opt => the option to be turned on
         '''
-        # switch on the current option
-        self.__selection.add(opt)
-
-        # find out all the dependencies of opt
-        opt_deps = self.__rules._getAllDependencies(opt)
-        # now switch on all theses dependencies manually (not recursively since there can
-        # be cyclic dependencies)
-        self.__selection = self.__selection.union(opt_deps)
-
-        # find out all the conflicts of opt
-        opt_confs = self.__rules._getAllConflicts(opt)
-        # now switch off all the conflicts:
-        map(lambda x: self.__switch_off(x), opt_confs)
-
-        # now manually generate all the conflicts of these opt_deps and switch them off
-        opt_deps_confs = set() # initialize to empty set
-        for opt_dep in opt_deps:
-            dep_confs = self.__rules._getAllConflicts(opt_dep)
-            opt_deps_confs = opt_deps_confs.union(dep_confs)
-        # switch off all the opt_deps_confs
-        map(lambda x: self.__switch_off(x), opt_deps_confs)
+        # the RuleSet knows which options need to be switched on (opt and all of
+        # its dependencies) and which ones off (their conflicts and the
+        # dependants of those), so apply both to the selection at once
+        on_mask, off_mask = self.__rules._getSwitchOnMasks(opt)
+        self.__selection = (self.__selection | on_mask) & ~off_mask
 
 
-    def __switch_off(self, opt):
+    def __switch_off(self, opt: Hashable) -> None:
         '''
             private helper to turn off a particular option including it's
             dependencies.
             @param
             opt => the option to be turned off
         '''
-        # switch off the clicked option
-        self.__selection.discard(opt)
-
-        # find out all the dependants of opt
-        opt_dependants = self.__rules._getAllDependants(opt)
-        # turn off all the dependants
-        self.__selection = self.__selection.difference(opt_dependants)
+        # switch off the clicked option along with all of its dependants
+        self.__selection &= ~self.__rules._getSwitchOffMask(opt)
 
     # ==========================================================================
     # Exposed API:
     # ==========================================================================
-    def selection(self):
+    def selection(self) -> set[Hashable]:
         '''
             getter method for the currently active options
             @return => a string slice of the currently active options
         '''
-        return self.__selection.copy() # return a new copy
+        return self.__rules._toSymbols(self.__selection) # decode into a new set
 
     # most important method
-    def toggle(self, opt):
+    def toggle(self, opt: Hashable) -> None:
         '''
             method to turn on or turn off a particular option
             @param
@@ -96,7 +322,7 @@ class Options:
         '''
         # implementation is pretty simple since we already have the switch on and
         # switch off methods already implemented
-        if(opt not in self.__selection):
+        if(not (self.__selection & self.__rules._getBit(opt))):
             # Option is off
             self.__switch_on(opt) # turn the opt on
 
@@ -110,38 +336,88 @@ class RuleSet:
         The Data type for holding the rules defined for certain options to be toggled
     '''
 
-    def __init__(self):
+    def __init__(self) -> None:
         '''
             constructor of the class. Creates an empty RuleSet
         '''
-        # initialize all that data structures to emty sets
-        self.__deps = set()
-        self.__confs = set()
-        self.__symbols = set()
+        # every symbol gets an integer id, which is also its bit index. So a set
+        # of symbols can be held in a single int (bit i set <=> symbol
+        # self.__names[i] is in the set). Internally only the ids are stored and
+        # they are translated back to the symbols by the getters. The ids are
+        # handed out contiguously, so they also serve as the set of symbols.
+        self.__idx: dict[Hashable, int] = {} # symbol => id
+        self.__names: list[Hashable] = [] # id => symbol
         # the preceding underscore means that all the members are private
 
-
-    def addDep(self, dest, source):
+        # forward adjacency of the dependency graph. Row i is the bitmask of the
+        # symbols that symbol i directly depends on. The reverse rows hold the
+        # symbols that directly depend on symbol i. Both kept in sync by addDep.
+        self.__rows: list[int] = []
+        self.__rrows: list[int] = []
+
+        # conflict adjacency. Row i is the bitmask of the symbols that are
+        # mutually exclusive with symbol i. Kept in sync by addConflict. These
+        # rows are the only store of the conflicts.
+        self.__conf_rows: list[int] = []
+
+        # disjoint set forest over the symbols, joining the symbols connected
+        # through conflicts. Kept in sync by addConflict.
+        self.__parent: list[int] = []
+        self.__rank: list[int] = []
+
+        # transitive closure of the dependencies. Row i is the bitmask of all the
+        # symbols that symbol i directly or indirectly depends on and the
+        # transposed rows hold the dependants. Both are built lazily on the first
+        # query and marked stale whenever the rules change.
+        self.__closure: list[int] = []
+        self.__rclosure: list[int] = []
+        self.__closure_valid: bool = False
+
+        # per symbol answers of the _getAll* queries and the masks used by the
+        # Options for toggling, materialized by freeze()
+        self.__frozen: bool = False
+        self.__all_deps: dict[Hashable, set[Hashable]] = {}
+        self.__all_dependants: dict[Hashable, set[Hashable]] = {}
+        self.__all_confs: dict[Hashable, set[Hashable]] = {}
+        self.__on_masks: list[int] = []
+        self.__off_masks: list[int] = []
+        self.__dependant_masks: list[int] = []
+
+        # result of the last coherence check, None when it needs to be redone
+        self.__coherent: Optional[bool] = None
+
+        # read-only views handed out by the _getDependencies, _getConflicts and
+        # _getSymbols getters. Built on the first call after a change
+        self.__deps_view: Optional[frozenset[tuple[Hashable, Hashable]]] = None
+        self.__confs_view: Optional[frozenset[tuple[Hashable, Hashable]]] = None
+        self.__symbols_view: Optional[frozenset[Hashable]] = None
+
+
+    def addDep(self, dest: Hashable, source: Hashable) -> None:
         '''
             method to add a dependency relation to the RuleSet
             @param
             dest => the symbol at the receiving end of dependency
             source => the symbol at the source of dependency
         '''
-        # the implementation logic is pretty simple
-        if(dest != source):
-            dependency = (dest, source) # the tuple representing the dependency relationship
-            self.__deps.add(dependency)
+        # register the two symbols. A symbol seen before keeps its id, so
+        # repeating entries will not occur
+        dest_idx = self.__addSymbol(dest); source_idx = self.__addSymbol(source)
+
+        # the implementation logic is pretty simple. The rows are the only store
+        # of the dependencies, so no tuple needs to be built for them
+        if(dest_idx != source_idx):
+            self.__rows[dest_idx] |= 1 << source_idx
+            self.__rrows[source_idx] |= 1 << dest_idx
 
         # if they are equal, I am handling the case in the areDependent method.
-        # There is no need to carry around self-dependencies in the deps list.
+        # There is no need to carry around self-dependencies in the rows.
 
-        # add the two new symbols to the set.
-        self.__symbols.add(dest); self.__symbols.add(source)
-        # set only contains unique entries. So, repeating entries will not occur
+        # the closure computed so far is no longer valid
+        self.__invalidate()
 
 
-    def addConflict(self, sym1, sym2):
+    def addConflict(self, sym1: Hashable, sym2: Hashable) -> None:
         '''
             method to add the mutual exclusion (conflict) relation to the RuleSet
             @param
@@ -151,26 +427,40 @@ class RuleSet:
         # implementation is again quite lucid
         assert sym1 != sym2, "There can never be a conflict between same symbols"
 
-        conflict = (sym1, sym2); rev_conflict = (sym2, sym1) # reverse is also same
-        # since 'a and b' mutually exclusive also means 'b and a' are too.
-        if(conflict not in self.__confs and rev_conflict not in self.__confs):
-            self.__confs.add(conflict)
+        # register the two symbols (known symbols keep their id)
+        idx1 = self.__addSymbol(sym1); idx2 = self.__addSymbol(sym2)
 
-        # add the two symbols to the symbol set
-        self.__symbols.add(sym1); self.__symbols.add(sym2)
+        # 'a and b' mutually exclusive also means 'b and a' are too. So record
+        # the conflict in both the directions (setting a bit twice is harmless,
+        # so the duplicates are dropped for free)
+        self.__conf_rows[idx1] |= 1 << idx2
+        self.__conf_rows[idx2] |= 1 << idx1
+        self.__union(idx1, idx2)
 
+        # new symbols might have been introduced, so rebuild the closure next time
+        self.__invalidate()
 
-    def isCoherent(self):
+
+    def isCoherent(self) -> bool:
         '''
             method to check if the Rules in the RuleSet are coherent
             @return => bool status of coherence
         '''
-        # Now that the areDependent method has been implemented, this method
-        # will be very simple to implement
+        # the check is only redone if the rules have changed since the last one
+        if(self.__coherent is None):
+            self.__coherent = self._computeCoherent()
+
+        return self.__coherent
 
-        # create shorthand function for NotDependent realtion
-        def areNotDependent(dest, source):
-            return not self.areDependent(dest, source)
+
+    def _computeCoherent(self) -> bool:
+        '''
+            method to actually run the coherence check (without the caching)
+            @return => bool status of coherence
+        '''
+        # Now that the closure has been implemented, this method will be very
+        # simple to implement. Everything below works on the ids.
+        self._ensureClosure()
 
         #=======================================================================
         # The following two conditions must be satisfied in order for a rule set
@@ -180,175 +470,473 @@ class RuleSet:
         #
         # b.) There shouldn't be any common dependence between the two conflicting
         # symbols in the confs list
+        #
+        # Counting every symbol among its own dependants, both of them boil down
+        # to: the two conflicting symbols must not have a common dependant
+        # (sym1 being a common dependant means that sym1 depends on sym2, and
+        # vice versa)
         #=======================================================================
 
-        # check the first condition
-        # check if any of the conflicts in the ruleSet are dependent
-        stat1 = map(lambda x: (areNotDependent(x[0], x[1]) and areNotDependent(x[1], x[0])),
-                        self.__confs)
+        # the transposed closure rows hold the dependants. Merging the dependants
+        # of all the conflicts of a symbol, the check becomes a single AND per
+        # symbol, without going through the (sym1, sym2) conflict pairs
+        dependants = [(1 << i) | row for i, row in enumerate(self.__rclosure)]
+        incoherent = any((dependants[sym] & self.__orRows(dependants, row))
+                        for sym, row in enumerate(self.__conf_rows) if row)
+
+        # return the coherence
+        return not incoherent
+
+
+    # ==========================================================================
+    # Private helper methods:
+    # ==========================================================================
+    def __invalidate(self) -> None:
+        '''
+            private helper to throw away everything derived from the rules.
+            To be called whenever the rules change.
+        '''
+        self.__closure_valid = False
+        self.__frozen = False
+        self.__coherent = None
+        self.__deps_view = None; self.__confs_view = None; self.__symbols_view = None
+
+    def __addSymbol(self, sym: Hashable) -> int:
+        '''
+            private helper to register a symbol with the RuleSet
+            @param
+            sym => the symbol to be added
+            @return => the bit index of sym
+        '''
+        if(sym not in self.__idx):
+            if(isinstance(sym, str)):
+                # keep the interned copy, so that the later lookups with equal
+                # strings mostly get away with an identity check
+                sym = sys.intern(sym)
+            self.__idx[sym] = len(self.__names)
+            self.__names.append(sym)
+            self.__rows.append(0) # no dependencies yet
+            self.__rrows.append(0) # no dependants yet
+            self.__conf_rows.append(0) # no conflicts yet
+            self.__parent.append(self.__idx[sym]); self.__rank.append(0) # own component
+
+        return self.__idx[sym]
+
+    def __find(self, sym_idx: int) -> int:
+        '''
+            private helper to find the representative of the conflict component
+            of a symbol (with path halving)
+            @param
+            sym_idx => id of the symbol
+            @return => id of the representative symbol
+        '''
+        parent = self.__parent
+        while(parent[sym_idx] != sym_idx):
+            parent[sym_idx] = parent[parent[sym_idx]]
+            sym_idx = parent[sym_idx]
+
+        return sym_idx
+
+    def __union(self, idx1: int, idx2: int) -> None:
+        '''
+            private helper to merge the conflict components of two symbols
+            (union by rank)
+            @param
+            idx1 => id of the first symbol
+            idx2 => id of the second symbol
+        '''
+        root1 = self.__find(idx1); root2 = self.__find(idx2)
+        if(root1 == root2):
+            return # already in the same component
+
+        if(self.__rank[root1] < self.__rank[root2]):
+            root1, root2 = root2, root1
+        self.__parent[root2] = root1
+        if(self.__rank[root1] == self.__rank[root2]):
+            self.__rank[root1] += 1
+
+    def __depends(self, dest_idx: int, source_idx: int) -> bool:
+        '''
+            private helper to check the dependence on the ids. The caller must
+            make sure that the closure is up to date.
+            @param
+            dest_idx => id of the receiving end of potential dependency
+            source_idx => id of the source of potential dependency
+            @return => bool status of the dependence
+        '''
+        return dest_idx == source_idx or bool((self.__closure[dest_idx] >> source_idx) & 1)
+
+    def __reaches(self, dest_idx: int, source_idx: int) -> bool:
+        '''
+            private helper to look for a dependency path from dest to source with
+            a bidirectional BFS: forward from dest over the rows and backward from
+            source over the reverse rows, always expanding the smaller frontier.
+            A symbol enters a side at most once, so cyclic dependencies are not a
+            problem.
+            @param
+            dest_idx => id of the receiving end of potential dependency
+            source_idx => id of the source of potential dependency
+            @return => bool status of the dependence
+        '''
+        fwd_seen = fwd_front = 1 << dest_idx # reached from dest
+        bwd_seen = bwd_front = 1 << source_idx # reaching source
+        while(fwd_front and bwd_front):
+            if(bin(fwd_front).count("1") <= bin(bwd_front).count("1")):
+                fwd_front = self.__orRows(self.__rows, fwd_front) & ~fwd_seen
+                if(fwd_front & bwd_seen):
+                    return True # the two searches met
+                fwd_seen |= fwd_front
+            else:
+                bwd_front = self.__orRows(self.__rrows, bwd_front) & ~bwd_seen
+                if(bwd_front & fwd_seen):
+                    return True
+                bwd_seen |= bwd_front
+
+        return False # one side ran out of symbols to visit
 
-        # reduce all the statuses into the final coherence status
-        check_a = reduce(lambda x, y: x and y, stat1, True)
+    def __conflictPairs(self) -> Iterator[tuple[int, int]]:
+        '''
+            private helper to list the conflicts from the conflict rows
+            @return => generator of (id, id) tuples, each conflict showing up once
+        '''
+        for sym1, row in enumerate(self.__conf_rows):
+            # every conflict sits in two rows, keep the one of the smaller id
+            for sym2 in _bits(row >> (sym1 + 1)):
+                yield sym1, sym1 + 1 + sym2
 
-        # check the second condition
-        # check for the remaining symbols if there is any common dependency between
-        # a conflicting rule
-        def check_common_dependence(sym1, sym2):
-            ''' helper method for single conflict rule checking'''
-            # filter out the remaining symbols after discarding the sym1 and sym2
-            rem = self.__symbols.copy() # create a copy of the symbols
-            rem.discard(sym1); rem.discard(sym2)
+    def __orRows(self, rows: list[int], mask: int) -> int:
+        '''
+            private helper to merge the rows of all the symbols in a mask
+            @param
+            rows => list of bitmask rows indexed by the symbol ids
+            mask => bitmask of the symbols whose rows are to be merged
+            @return => bitwise OR of the selected rows
+        '''
+        merged = 0
+        for i in _bits(mask):
+            merged |= rows[i]
 
-            # for every rem symbol, make sure there is no dependency between sym1 and sym2
-            return reduce(lambda x, y: x or y,
-              map(lambda x: (self.areDependent(x, sym1) and self.areDependent(x, sym2)), rem), False)
+        return merged
 
-        # check common dependence for all the conflicts
-        check_b = reduce(lambda x, y: x or y,
-            map(lambda x: check_common_dependence(x[0], x[1]), self.__confs), False)
+    def __switchOnMasks(self, sym_idx: int) -> tuple[int, int]:
+        '''
+            private helper to compute what switching on a symbol implies. The
+            caller must make sure that the closure is up to date.
+            @param
+            sym_idx => id of the symbol being switched on
+            @return => (bitmask of the symbols to switch on,
+                        bitmask of the symbols to switch off)
+        '''
+        # the symbol and all of its dependencies
+        on_mask = (1 << sym_idx) | self.__closure[sym_idx]
 
-        # return the coherence (check_a should be True and check_b should be False)
-        return check_a and (not check_b)
+        # all the conflicts of these and all the dependants of those conflicts
+        off_seed = self.__orRows(self.__conf_rows, on_mask)
+        off_mask = off_seed | self.__orRows(self.__rclosure, off_seed)
 
+        return on_mask, off_mask
 
-    # Recursive method
-    def areDependent(self, dest, source):
+    def __toSymbols(self, mask: int) -> set[Hashable]:
         '''
-            Recursive method to check if the two symbols directly or indirectly
+            private helper to decode a bitmask back into the symbols it holds
+            @param
+            mask => bitmask of symbol indices
+            @return => set of the symbols whose bits are set in mask
+        '''
+        names = self.__names
+        return {names[i] for i in _bits(mask)}
+
+    def _ensureClosure(self) -> None:
+        '''
+            private helper to (re)build the transitive closure of the dependencies
+            if it has been invalidated by a change in the rules.
+        '''
+        if(self.__closure_valid):
+            return # closure is still up to date
+
+        n = len(self.__rows)
+        if(HAVE_CLIB and n > JIT_MIN_SYMBOLS):
+            # large RuleSet and the native helpers have been built. No warm up
+            # cost, so they are preferred over numba
+            closure, rclosure = _cClosure(self.__rows)
+
+        elif(HAVE_NUMBA and n > JIT_MIN_SYMBOLS):
+            # large RuleSet, let the compiled version do the heavy lifting
+            # (including the transposition for the dependants lookups)
+            closure, rclosure = _jitClosure(self.__rows)
+
+        elif(n <= WARSHALL_MAX_SYMBOLS):
+            # small RuleSet, the closure of the reversed rows is the transpose
+            # so there is nothing to transpose bit by bit
+            closure = _warshallClosure(self.__rows)
+            rclosure = _warshallClosure(self.__rrows)
+
+        else:
+            # merge the rows along the topological order of the dependency graph
+            closure = _sccClosure(self.__rows, self.__rrows)
+
+            # transpose the closure for the dependants lookups
+            rclosure = [0] * n
+            for i in range(n):
+                bit = 1 << i
+                for j in _bits(closure[i]):
+                    rclosure[j] |= bit
+
+        self.__closure = closure; self.__rclosure = rclosure
+        self.__closure_valid = True
+
+
+    def freeze(self) -> None:
+        '''
+            method to precompute all the dependencies, dependants and conflicts
+            of every symbol, so that areDependent and the _getAll* queries become
+            simple lookups.
+            Adding a rule afterwards unfreezes the RuleSet again.
+        '''
+        if(self.__frozen):
+            return # nothing changed since the last freeze
+
+        self._ensureClosure()
+
+        all_deps = {}; all_dependants = {}; all_confs = {}
+        for sym, i in self.__idx.items():
+            not_self = ~(1 << i) # sym shows up in its own rows only through a cycle
+            all_deps[sym] = self.__toSymbols(self.__closure[i] & not_self)
+            all_dependants[sym] = self.__toSymbols(self.__rclosure[i] & not_self)
+            all_confs[sym] = self.__toSymbols(self.__conf_rows[i])
+
+        on_masks = []; off_masks = []
+        for i in range(len(self.__names)):
+            on_mask, off_mask = self.__switchOnMasks(i)
+            on_masks.append(on_mask); off_masks.append(off_mask)
+
+        self.__all_deps = all_deps
+        self.__all_dependants = all_dependants
+        self.__all_confs = all_confs
+        self.__on_masks = on_masks
+        self.__off_masks = off_masks
+        self.__dependant_masks = [(1 << i) | row for i, row in enumerate(self.__rclosure)]
+        self.__frozen = True
+
+
+    def areDependent(self, dest: Hashable, source: Hashable) -> bool:
+        '''
+            method to check if the two symbols directly or indirectly
             depend on each other.
             @Param
             dest => receiving end of potential dependency
             source => source of potential dependency
         '''
 
-        assert dest in self.__symbols, "Destination symbol should be in symbol list"
-        assert source in self.__symbols, "Source symbol should be in symbol list"
+        assert dest in self.__idx, "Destination symbol should be in symbol list"
+        assert source in self.__idx, "Source symbol should be in symbol list"
 
-        if(((dest, source) in self.__deps) or source == dest):
-            ''' Base case ''' # "a" always depends on "a". That's why the second condition
-            return True
+        if(self.__frozen):
+            # the answers have been precomputed, so it is a plain lookup
+            return dest == source or source in self.__all_deps[dest]
 
-        else:
-            ''' Recursion case '''
-            # extract lists of elements that are directly depended upon by dest
-            # and those that directly depend on source
-            check_dst = []; check_src = [] # initialy empty lists
-            for dependency in self.__deps:
-                if(dependency[0] == dest):
-                    check_dst.append(dependency[1])
-                if(dependency[1] == source):
-                    check_src.append(dependency[0])
-
-            # now check if there is any symbol in check_dst that also appears in check_src
-            dependence_found = False
-            for sym in check_dst:
-                if(sym in check_src):
-                    dependence_found = True # dependence has been located
-                    break;
-
-            if(dependence_found):
-                return True # if we have located a dependence, then return true
+        dest_idx = self.__idx[dest]; source_idx = self.__idx[source]
+        if(not self.__rows[dest_idx] or not self.__rrows[source_idx]):
+            # dest doesn't depend on anything or nothing depends on source. So
+            # there is no need to (re)build the closure to answer this one
+            return dest_idx == source_idx
 
-            else:
-                # generate full cross join of check_dst and check_src.
-                # if len(check_dst) = 3 and len(check_src) = 4
-                # there will be in all 3 * 4 = 12 elements in the cross join
-                crs_join = [] # initialize to empty list
-                for sym1 in check_dst:
-                    for sym2 in check_src:
-                        crs_join.append((sym1, sym2))
+        if(not self.__closure_valid):
+            # the rules changed since the closure was built. A single query is
+            # cheaper to answer by walking the graph than by rebuilding the whole
+            # closure (which the bulk queries will do when they need it)
+            dest_row = self.__rows[dest_idx]
+            if((dest_row >> source_idx) & 1 or dest_row & self.__rrows[source_idx]):
+                # dest directly depends on source, or on a symbol that directly
+                # depends on source. The AND of the two rows finds the latter
+                return True
+
+            return dest_idx == source_idx or self.__reaches(dest_idx, source_idx)
 
-                # now perform the checks recursively
-                return reduce(lambda x, y: x or y,
-                            map(lambda x: self.areDependent(x[0], x[1]), crs_join), False)
+        # "a" always depends on "a", __depends takes care of that as well
+        return self.__depends(dest_idx, source_idx)
 
 
     # ==========================================================================
     # Following are some of the utility methods. They are not necessarily used
     # for any logical operations
     # ==========================================================================
-    def _getDependencies(self):
+    def _getDependencies(self) -> frozenset[tuple[Hashable, Hashable]]:
         '''
             method to return the dependencies currently in the RuleSet
-            @return => the dependencies
+            @return => read-only set of the dependencies
         '''
-        return self.__deps.copy() # be careful not to return the private copy
+        if(self.__deps_view is None):
+            # rebuild the (dest, source) tuples from the rows
+            names = self.__names
+            self.__deps_view = frozenset((names[dest], names[source])
+                    for dest, row in enumerate(self.__rows) for source in _bits(row))
 
-    def _getConflicts(self):
+        # being immutable, the same view can be shared until the rules change
+        return self.__deps_view
+
+    def _getConflicts(self) -> frozenset[tuple[Hashable, Hashable]]:
         '''
             method to return the conflicts currently in the RuleSet
-            @return => the conflicts
+            @return => read-only set of the conflicts
         '''
-        return self.__confs.copy()
+        if(self.__confs_view is None):
+            names = self.__names
+            self.__confs_view = frozenset((names[sym1], names[sym2])
+                    for (sym1, sym2) in self.__conflictPairs())
+
+        return self.__confs_view
 
-    def _getSymbols(self):
+    def _getSymbols(self) -> frozenset[Hashable]:
         '''
             method to return the Symbols currently in the RuleSet
-            @return => the unique symbols in use
+            @return => read-only set of the unique symbols in use
         '''
-        return self.__symbols.copy()
+        if(self.__symbols_view is None):
+            self.__symbols_view = frozenset(self.__names)
 
-    def _getAllDependencies(self, sym):
+        return self.__symbols_view
+
+    def _getAllDependencies(self, sym: Hashable) -> set[Hashable]:
         '''
             method to return all the possible dependencies of the given symbol
             @param
             sym => the symbol to find all the dependencies of
             @return => set of all the dependencies of sym
         '''
-        assert sym in self.__symbols, "Can't fetch dependencies. symbol not in ruleSet"
+        assert sym in self.__idx, "Can't fetch dependencies. symbol not in ruleSet"
 
-        check = self.__symbols.copy(); check.discard(sym)
+        if(self.__frozen):
+            return self.__all_deps[sym].copy()
 
-        # compute the dependencies
-        deps = set() # initialize to empty list
-        for sym_check in check:
-            if(self.areDependent(sym, sym_check)):
-                deps.add(sym_check)
+        # decode the closure row of sym
+        self._ensureClosure()
+        # (sym shows up in its own row only through a cycle, mask it out)
+        i = self.__idx[sym]
+        deps = self.__toSymbols(self.__closure[i] & ~(1 << i))
 
         # return the computed dependencies:
         return deps
 
-    def _getAllConflicts(self, sym):
+    def _getAllConflicts(self, sym: Hashable) -> set[Hashable]:
         '''
             method to find out all the conflicts of a given symbol
             @param
             sym => the symbol whose conflicts are to be computed
             @return => set of all the conflicts of sym
         '''
-        assert sym in self.__symbols, "Can't fetch conflicts. symbol not in ruleset"
+        assert sym in self.__idx, "Can't fetch conflicts. symbol not in ruleset"
+
+        if(self.__frozen):
+            return self.__all_confs[sym].copy()
 
-        sym_confs = set() # initialize to empty set
+        # the conflicts are already indexed per symbol
+        return self.__toSymbols(self.__conf_rows[self.__idx[sym]])
 
-        # compute the conflicts:
-        for conf in self.__confs:
-            if(conf[0] == sym):
-                sym_confs.add(conf[1])
-            if(conf[1] == sym):
-                sym_confs.add(conf[0])
+    def _areConflicting(self, sym1: Hashable, sym2: Hashable) -> bool:
+        '''
+            method to check if two symbols are mutually exclusive
+            @param
+            sym1 => first symbol
+            sym2 => second symbol
+            @return => bool status of the conflict
+        '''
+        assert sym1 in self.__idx, "Can't check the conflict. symbol not in ruleset"
+        assert sym2 in self.__idx, "Can't check the conflict. symbol not in ruleset"
 
-        # return the so computed conflicts
-        return sym_confs
+        # a single bit test on the conflict row, however many conflicts there are
+        return bool((self.__conf_rows[self.__idx[sym1]] >> self.__idx[sym2]) & 1)
 
-    def _getAllDependants(self, sym):
+    def _inConflictComponent(self, sym1: Hashable, sym2: Hashable) -> bool:
+        '''
+            method to check if two symbols are connected through a chain of
+            conflicts (sym1 conflicts with x, x conflicts with y, ..., with sym2)
+            @param
+            sym1 => first symbol
+            sym2 => second symbol
+            @return => bool status of the connection
+        '''
+        assert sym1 in self.__idx, "Can't check the component. symbol not in ruleset"
+        assert sym2 in self.__idx, "Can't check the component. symbol not in ruleset"
+
+        return self.__find(self.__idx[sym1]) == self.__find(self.__idx[sym2])
+
+    def _getAllDependants(self, sym: Hashable) -> set[Hashable]:
         '''
             method to find out all the dependants of a given symbol
             @param
             sym => the symbol whose dependants are to be computed
             @return => set of all the dependants of sym
         '''
-        assert sym in self.__symbols, "Can't fetch the dependants. symbol not in ruleset"
+        assert sym in self.__idx, "Can't fetch the dependants. symbol not in ruleset"
 
-        check = self.__symbols.copy(); check.discard(sym)
+        if(self.__frozen):
+            return self.__all_dependants[sym].copy()
 
-        # compute all the dependants:
-        sym_dependants = set() # initialize to empty set
-        for sym_check in check:
-            if(self.areDependent(sym_check, sym)):
-                sym_dependants.add(sym_check)
+        # decode the transposed closure row of sym
+        self._ensureClosure()
+        i = self.__idx[sym]
+        sym_dependants = self.__toSymbols(self.__rclosure[i] & ~(1 << i))
 
         # return the so computed sym_dependants:
         return sym_dependants
 
+    # ==========================================================================
+    # Following are the bitmask counterparts of the above methods. They are used
+    # by the Options for holding the selection as a bitmask of the symbol ids
+    # ==========================================================================
+    def _getBit(self, sym: Hashable) -> int:
+        '''
+            method to return the bit of a symbol
+            @param
+            sym => the symbol whose bit is required
+            @return => int with only the bit of sym set
+        '''
+        assert sym in self.__idx, "Can't fetch the bit. symbol not in ruleset"
+
+        return 1 << self.__idx[sym]
+
+    def _toSymbols(self, mask: int) -> set[Hashable]:
+        '''
+            method to decode a bitmask of symbol ids
+            @param
+            mask => the bitmask to be decoded
+            @return => set of the symbols whose bits are set in mask
+        '''
+        return self.__toSymbols(mask)
+
+    def _getSwitchOnMasks(self, sym: Hashable) -> tuple[int, int]:
+        '''
+            method to find out what switching on the given symbol implies
+            @param
+            sym => the symbol to be switched on
+            @return => (bitmask of sym and all of its dependencies,
+                        bitmask of their conflicts and all the dependants of those)
+        '''
+        assert sym in self.__idx, "Can't fetch the masks. symbol not in ruleset"
+
+        if(self.__frozen):
+            return self.__on_masks[self.__idx[sym]], self.__off_masks[self.__idx[sym]]
+
+        self._ensureClosure()
+        return self.__switchOnMasks(self.__idx[sym])
+
+    def _getSwitchOffMask(self, sym: Hashable) -> int:
+        '''
+            method to find out what switching off the given symbol implies
+            @param
+            sym => the symbol to be switched off
+            @return => bitmask of sym and all of its dependants
+        '''
+        assert sym in self.__idx, "Can't fetch the mask. symbol not in ruleset"
+
+        i = self.__idx[sym]
+        if(self.__frozen):
+            return self.__dependant_masks[i]
+
+        self._ensureClosure()
+        return (1 << i) | self.__rclosure[i]
+
 #===============================================================================
 #-------------------------------------------------------------------------------
 # API USAGE AND GENERAL MODULE TESTING SCRIPT:
@@ -357,7 +945,7 @@ class RuleSet:
 if(__name__ == "__main__"):
     ''' Api usage script and naive testing '''
 
-    print "\n\t\t!!! Welcome to the api usage script !!!\n"
+    print("\n\t\t!!! Welcome to the api usage script !!!\n")
 
     # create a new RuleSet object
     rs = RuleSet()
@@ -367,14 +955,14 @@ if(__name__ == "__main__"):
     rs.addDep("c", "d")
 
     # print and check the currently present
-    print "Currently present dependencies: " + str(rs._getDependencies()) + "\n\n"
-# print ts.areDependent("deman", "yondu")
-    # print ts.areDependent("e", "a")
-    # print ts.areDependent("a", "a")
+    print("Currently present dependencies: " + str(rs._getDependencies()) + "\n\n")
+# print(ts.areDependent("deman", "yondu"))
+    # print(ts.areDependent("e", "a"))
+    # print(ts.areDependent("a", "a"))
     rs.addConflict("e", "f")
 
     # print and check the currently present conflicts
-    print "Currently present conflicts: " + str(rs._getConflicts()) + "\n\n"
+    print("Currently present conflicts: " + str(rs._getConflicts()) + "\n\n")
 
     ts = RuleSet()
     ts.addDep("a", "b")
@@ -383,8 +971,8 @@ if(__name__ == "__main__"):
     ts.addDep("d", "e")
     ts.addConflict("k", "d")
     # ts.addConflict("b", "b") # This raises an AssertionError
-    print "All symbols in RuleSet: " + str(ts._getSymbols())
-    print ts.areDependent("k", "d")
-    print ts.areDependent("e", "a")
-    print ts.areDependent("a", "a")
-    print ts.isCoherent()
+    print("All symbols in RuleSet: " + str(ts._getSymbols()))
+    print(ts.areDependent("k", "d"))
+    print(ts.areDependent("e", "a"))
+    print(ts.areDependent("a", "a"))
+    print(ts.isCoherent())
@@ -1,10 +1,53 @@
 # Run with: `python -m unittest discover`
 
+from __future__ import annotations
+
+import random
 import unittest
+from unittest import mock
 
+import ruleset
 from ruleset import RuleSet, Options
 
 
+def _bigRuleSet(conflict: str) -> RuleSet:
+    '''
+        helper to build a RuleSet with more than WARSHALL_MAX_SYMBOLS symbols:
+        a chain s0 -> s1 -> ... -> s99 closed into a cycle s99 -> s50 and a
+        conflict between s1 and the given symbol
+    '''
+    rs = RuleSet()
+    for i in range(99):
+        rs.addDep("s%d" % i, "s%d" % (i + 1))
+    rs.addDep("s99", "s50")
+    rs.addConflict("s1", conflict)
+    return rs
+
+
+def _randomRows(n: int, edges: int) -> tuple[list[int], list[int]]:
+    '''
+        helper to build the int bitmask rows of a random graph and its reverse
+    '''
+    rng = random.Random(n)
+    rows = [0] * n; rrows = [0] * n
+    for _ in range(edges):
+        dest, source = rng.randrange(n), rng.randrange(n)
+        rows[dest] |= 1 << source; rrows[source] |= 1 << dest
+    return rows, rrows
+
+
+def _transposeRows(rows: list[int]) -> list[int]:
+    '''
+        helper to transpose int bitmask rows bit by bit
+    '''
+    result = [0] * len(rows)
+    for i, row in enumerate(rows):
+        for j in range(len(rows)):
+            if((row >> j) & 1):
+                result[j] |= 1 << i
+    return result
+
+
 class Test(unittest.TestCase):
     def test_depends_aa(self):
         rs = RuleSet()
@@ -38,6 +81,34 @@ class Test(unittest.TestCase):
 
         self.assertFalse(rs.isCoherent(), "rs.isCoherent failed")
 
+    def test_exclusive_ab_ba(self):
+        rs = RuleSet()
+
+        rs.addConflict("a", "b")
+        rs.addConflict("b", "a")
+
+        # the conflict is symmetric, so it must be stored only once
+        self.assertEqual(len(rs._getConflicts()), 1, "rs._getConflicts failed")
+        self.assertSetEqual(rs._getAllConflicts("a"), set(["b"]))
+        self.assertSetEqual(rs._getAllConflicts("b"), set(["a"]))
+        self.assertTrue(rs._areConflicting("b", "a"), "rs._areConflicting failed")
+
+        rs.addDep("c", "a")
+        self.assertFalse(rs._areConflicting("a", "c"), "rs._areConflicting failed")
+
+    def test_conflict_component(self):
+        rs = RuleSet()
+
+        rs.addConflict("a", "b")
+        rs.addConflict("b", "c")
+        rs.addConflict("d", "e")
+        rs.addDep("c", "d")
+
+        self.assertTrue(rs._inConflictComponent("a", "c"), "rs._inConflictComponent failed")
+        self.assertTrue(rs._inConflictComponent("e", "d"), "rs._inConflictComponent failed")
+        # dependencies don't connect the conflict components
+        self.assertFalse(rs._inConflictComponent("c", "d"), "rs._inConflictComponent failed")
+
     def test_deep_deps(self):
         rs = RuleSet()
 
@@ -50,6 +121,48 @@ class Test(unittest.TestCase):
 
         self.assertFalse(rs.isCoherent(), "rs.isCoherent failed")
 
+    def test_cyclic_deps(self):
+        rs = RuleSet()
+
+        rs.addDep("a", "b")
+        rs.addDep("b", "c")
+        rs.addDep("c", "a")
+        rs.addDep("d", "e")
+        rs.addConflict("a", "d")
+
+        # the cycle must neither hang the queries nor make the rules incoherent
+        self.assertTrue(rs.areDependent("c", "b"), "rs.areDependent failed")
+        self.assertFalse(rs.areDependent("a", "e"), "rs.areDependent failed")
+        self.assertTrue(rs.isCoherent(), "rs.isCoherent failed")
+
+        rs.addConflict("b", "c")
+        self.assertFalse(rs.isCoherent(), "rs.isCoherent failed")
+
+    # Queries on a stale closure go through the bidirectional search.
+    def test_stale_long_paths(self):
+        rs = RuleSet()
+
+        # a -> b -> c -> d -> e, a has extra dependencies so that the backward
+        # frontier (from e) is the smaller one
+        for dest, source in zip("abcd", "bcde"):
+            rs.addDep(dest, source)
+        for sym in ("x1", "x2", "x3"):
+            rs.addDep("a", sym)
+        # p -> q -> r -> s -> t, equal frontiers so the forward search meets
+        for dest, source in zip("pqrs", "qrst"):
+            rs.addDep(dest, source)
+
+        queries = [("a", "e"), ("p", "t"), ("b", "x1"), ("q", "e"), ("e", "a")]
+        with mock.patch.object(RuleSet, "_RuleSet__reaches", autospec=True,
+                               side_effect=getattr(RuleSet, "_RuleSet__reaches")) as reaches:
+            stale = [rs.areDependent(dest, source) for dest, source in queries]
+            self.assertEqual(reaches.call_count, 4, "bidirectional search not used")
+
+        self.assertEqual(stale, [True, True, False, False, False], "rs.areDependent failed")
+        self.assertTrue(rs.isCoherent(), "rs.isCoherent failed")
+        self.assertEqual(stale, [rs.areDependent(dest, source) for dest, source in queries],
+                         "rs.areDependent failed")
+
     def test_exclusive_ab_bc_ca_de(self):
         rs = RuleSet()
         rs.addDep("a", "b")
@@ -100,6 +213,17 @@ class Test(unittest.TestCase):
             "toggle expected (g, f) got %s" % opts.selection(),
         )
 
+    def test_coherence_after_new_rule(self):
+        rs = RuleSet()
+
+        rs.addDep("a", "b")
+        rs.addDep("b", "c")
+        self.assertTrue(rs.isCoherent(), "rs.isCoherent failed")
+
+        # the new conflict must not be hidden by the previous result
+        rs.addConflict("a", "c")
+        self.assertFalse(rs.isCoherent(), "rs.isCoherent failed")
+
     def test_ab_bc_toggle(self):
         rs = RuleSet()
 
@@ -114,6 +238,106 @@ class Test(unittest.TestCase):
             "toggle expected (c) got %s" % opts.selection(),
         )
 
+    def test_freeze_add_dep(self):
+        rs = RuleSet()
+
+        rs.addDep("a", "b")
+        rs.addDep("b", "g")
+        rs.addConflict("b", "c")
+        rs.addDep("e", "f")
+        rs.addDep("f", "e")
+        rs.freeze()
+
+        self.assertSetEqual(rs._getAllDependencies("a"), set(["b", "g"]))
+        self.assertSetEqual(rs._getAllConflicts("c"), set(["b"]))
+
+        # the frozen lookups
+        self.assertTrue(rs.areDependent("a", "a"), "rs.areDependent failed")
+        self.assertTrue(rs.areDependent("a", "g"), "rs.areDependent failed")
+        self.assertFalse(rs.areDependent("g", "a"), "rs.areDependent failed")
+        self.assertTrue(rs.areDependent("f", "f"), "rs.areDependent failed")
+        self.assertTrue(rs.areDependent("e", "e"), "rs.areDependent failed")
+        self.assertTrue(rs.areDependent("f", "e"), "rs.areDependent failed")
+        self.assertFalse(rs.areDependent("a", "f"), "rs.areDependent failed")
+
+        # adding a rule after the freeze must be taken into account
+        rs.addDep("b", "d")
+        self.assertSetEqual(rs._getAllDependencies("a"), set(["b", "d", "g"]))
+        self.assertSetEqual(rs._getAllDependants("d"), set(["a", "b"]))
+
+        rs.freeze()
+        rs.addDep("g", "e")
+        self.assertTrue(rs.areDependent("a", "f"), "rs.areDependent failed")
+
+    # The cached getter views follow the changes of the rules.
+    def test_getters_after_new_rule(self):
+        rs = RuleSet()
+        rs.addDep("a", "b")
+        rs.addConflict("a", "c")
+
+        for view in (rs._getSymbols(), rs._getDependencies(), rs._getConflicts()):
+            self.assertIsInstance(view, frozenset)
+            self.assertRaises(AttributeError, getattr, view, "add")
+        self.assertSetEqual(rs._getSymbols(), set(["a", "b", "c"]))
+
+        rs.addDep("b", "d")
+        self.assertSetEqual(rs._getSymbols(), set(["a", "b", "c", "d"]))
+        self.assertSetEqual(rs._getDependencies(), set([("a", "b"), ("b", "d")]))
+
+        rs.addConflict("d", "e")
+        self.assertIn("e", rs._getSymbols())
+        confs = rs._getConflicts()
+        self.assertEqual(len(confs), 2, "rs._getConflicts failed")
+        self.assertTrue(("d", "e") in confs or ("e", "d") in confs, "rs._getConflicts failed")
+
+    # Large RuleSet (SCC closure) against the small (Warshall) path.
+    def test_big_chain(self):
+        for conflict in ("x", "s70"):
+            with mock.patch.object(ruleset, "_sccClosure", wraps=ruleset._sccClosure) as scc:
+                big = _bigRuleSet(conflict)
+                coherent = big.isCoherent()
+                self.assertTrue(scc.called, "_sccClosure not used")
+            symbols = sorted(big._getSymbols())
+
+            with mock.patch.object(ruleset, "WARSHALL_MAX_SYMBOLS", 1000):
+                small = _bigRuleSet(conflict)
+                self.assertEqual(coherent, small.isCoherent(), "rs.isCoherent failed")
+                for sym in symbols:
+                    self.assertSetEqual(big._getAllDependencies(sym),
+                                        small._getAllDependencies(sym))
+                    self.assertSetEqual(big._getAllDependants(sym),
+                                        small._getAllDependants(sym))
+                for dest in ("s0", "s50", "s99", conflict):
+                    for source in symbols:
+                        self.assertEqual(big.areDependent(dest, source),
+                                         small.areDependent(dest, source),
+                                         "rs.areDependent failed")
+
+        # s1 depends on s70 that it conflicts with, x is unrelated
+        self.assertFalse(coherent, "rs.isCoherent failed")
+        self.assertTrue(_bigRuleSet("x").isCoherent(), "rs.isCoherent failed")
+        self.assertSetEqual(big._getAllDependencies("s99"),
+                            set("s%d" % i for i in range(50, 99)))
+        self.assertSetEqual(big._getAllDependants("s0"), set())
+
+    # Native closure against the pure python one.
+    @unittest.skipUnless(ruleset.HAVE_CLIB, "libwarshall.so not built")
+    def test_native_closure(self):
+        n = ruleset.JIT_MIN_SYMBOLS + 72
+        rows, rrows = _randomRows(n, 2 * n)
+        closure = ruleset._sccClosure(rows, rrows)
+        self.assertEqual(ruleset._cClosure(rows), (closure, _transposeRows(closure)),
+                         "_cClosure failed")
+
+    # Jit compiled closure against the pure python one.
+    @unittest.skipUnless(ruleset.HAVE_NUMBA, "numba not installed")
+    def test_jit_closure(self):
+        n = ruleset.JIT_MIN_SYMBOLS + 72
+        rows, rrows = _randomRows(n, 2 * n)
+        closure = ruleset._sccClosure(rows, rrows)
+        self.assertEqual(ruleset._jitClosure(rows), (closure, _transposeRows(closure)),
+                         "_jitClosure failed")
+
     # Multiple dependencies and exclusions.
     def test_ab_ac(self):
         rs = RuleSet()
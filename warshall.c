@@ -0,0 +1,54 @@
+/*
+    ============================================================================
+    Module: warshall
+    ============================================================================
+    Optional native helpers for the RuleSet closure computation of large
+    RuleSets. The RuleSet module loads them through ctypes when the shared
+    library has been built next to it:
+
+        cc -O3 -shared -fPIC -o libwarshall.so warshall.c
+*/
+
+#include <stdint.h>
+
+/*
+    Warshall's algorithm on a bit packed adjacency matrix. Row i holds the bits
+    of the symbols that symbol i depends on, 64 per word, words_per_row words
+    per row. The rows are updated in place into the transitive closure.
+*/
+void warshall(uint64_t* adj, int words_per_row, int n)
+{
+    for(int k = 0; k < n; k++)
+    {
+        int kw = k >> 6; uint64_t kb = 1ULL << (k & 63);
+        uint64_t* ak = adj + (long)k * words_per_row;
+        for(int i = 0; i < n; i++)
+        {
+            uint64_t* ai = adj + (long)i * words_per_row;
+            if(ai[kw] & kb)
+            {
+                // plain loop over the words, left to the compiler to vectorize
+                for(int w = 0; w < words_per_row; w++)
+                    ai[w] |= ak[w];
+            }
+        }
+    }
+}
+
+/*
+    Transpose the bit packed square matrix adj into result (which must be
+    zeroed by the caller).
+*/
+void transpose(const uint64_t* adj, uint64_t* result, int words_per_row, int n)
+{
+    for(int i = 0; i < n; i++)
+    {
+        const uint64_t* ai = adj + (long)i * words_per_row;
+        uint64_t ib = 1ULL << (i & 63); int iw = i >> 6;
+        for(int j = 0; j < n; j++)
+        {
+            if(ai[j >> 6] & (1ULL << (j & 63)))
+                result[(long)j * words_per_row + iw] |= ib;
+        }
+    }
+}